@@ -434,6 +434,7 @@ class LoRAFinetuneRecipeSingleDevice(FTRecipeInterface):
         if self._is_pissa:
             assert isinstance(cfg_model.pissa_config, DictConfig)
             self.fsvd_niter = cfg_model.pissa_config.get('fsvd_iter')
+            self.full_svd = cfg_model.pissa_config.get('full_svd', False)
             self.quant_iter = cfg_model.pissa_config.get('quant_iter')
             self.merge_s2uv = cfg_model.pissa_config.get('merge_s2uv') # TODO
         set_trainable_params(model, self.adapter_params)
@@ -460,9 +461,12 @@ class LoRAFinetuneRecipeSingleDevice(FTRecipeInterface):
                 if hasattr(m, "initialize_pissa"):
                     if self.fsvd_niter is not None:
                         print(f"Perform Fast SVD with niter={self.fsvd_niter} on the {n} layer.")
+                    elif self.full_svd:
+                        print(f"Perform full SVD on the {n} layer.")
                     else:
-                        print(f"Perform SVD on the {n}.")
-                    m.initialize_pissa(self.fsvd_niter)
+                        # initialize_pissa falls back to the full SVD for small weights
+                        print(f"Perform randomized SVD with niter=2 on the {n} layer.")
+                    m.initialize_pissa(self.fsvd_niter, full_svd=self.full_svd)
         if lora_weights_state_dict:
             lora_missing, lora_unexpected = model.load_state_dict(
                 lora_weights_state_dict, strict=False
@@ -0,0 +1,437 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+import weakref
+
+import pytest
+
+import torch
+import torch.nn.functional as F
+from torchao.dtypes.nf4tensor import NF4Tensor
+from torchtune import training
+from torchtune.modules.peft import disable_adapter, get_adapter_params, PiSSALinear
+from torchtune.modules.peft.pissa import QATPiSSALinear
+from torchtune.training.quantization import _torchao_0_7_supported
+from torchtune.training.seed import set_seed
+
+
+RANK = 4
+ALPHA = 1.0
+BSZ = 2
+SEQ_LEN = 32
+
+
+@pytest.fixture(autouse=True)
+def random():
+    set_seed(16)
+
+
+def _reference_forward(pissa_linear: PiSSALinear, x: torch.Tensor) -> torch.Tensor:
+    """Unmerged PiSSA forward, computed directly from the module's parameters."""
+    out = F.linear(x, pissa_linear.weight, pissa_linear.bias)
+    lora_out = F.linear(x, pissa_linear.pissa_u_weight) * pissa_linear.pissa_s
+    return out + F.linear(lora_out, pissa_linear.pissa_v_weight)
+
+
+class TestPiSSALinear:
+    """
+    Class for testing our PiSSALinear implementation.
+    """
+
+    @pytest.fixture
+    def in_dim(self) -> int:
+        return 64
+
+    @pytest.fixture
+    def out_dim(self) -> int:
+        return 128
+
+    @pytest.fixture
+    def inputs(self, in_dim) -> torch.Tensor:
+        inputs = torch.randn(BSZ, SEQ_LEN, in_dim)
+        return inputs
+
+    @pytest.fixture
+    def pissa_linear(self, in_dim, out_dim) -> PiSSALinear:
+        def create_pissa_linear(
+            use_bias=True,
+            dtype=torch.float32,
+            initialize_pissa=True,
+            merge_in_eval=False,
+        ):
+            with training.set_default_dtype(dtype):
+                pissa_linear = PiSSALinear(
+                    in_dim=in_dim,
+                    out_dim=out_dim,
+                    rank=RANK,
+                    alpha=ALPHA,
+                    use_bias=use_bias,
+                    merge_in_eval=merge_in_eval,
+                )
+            if initialize_pissa:
+                pissa_linear.initialize_pissa()
+            return pissa_linear
+
+        return create_pissa_linear
+
+    @pytest.fixture
+    def qpissa_linear(self):
+        def create_qpissa_linear(
+            use_bias=False,
+            dtype=torch.float32,
+            in_dim=512,
+            out_dim=512,
+            merge_in_eval=False,
+        ):
+            with training.set_default_dtype(dtype):
+                qpissa_linear = PiSSALinear(
+                    in_dim=in_dim,
+                    out_dim=out_dim,
+                    rank=RANK,
+                    alpha=ALPHA,
+                    use_bias=use_bias,
+                    quantize_base=True,
+                    merge_in_eval=merge_in_eval,
+                )
+            # pissa_s is zero-initialized, give the adapter a non-trivial output
+            with torch.no_grad():
+                qpissa_linear.pissa_s.uniform_()
+            return qpissa_linear
+
+        return create_qpissa_linear
+
+    @pytest.mark.parametrize(
+        "fsvd_niter, full_svd", [(None, False), (None, True), (RANK, False)]
+    )
+    def test_initialize_pissa_preserves_weight(
+        self, pissa_linear, fsvd_niter, full_svd
+    ) -> None:
+        pissa_linear = pissa_linear(initialize_pissa=False)
+        base_weight = pissa_linear.weight.detach().clone()
+        pissa_linear.initialize_pissa(fsvd_niter, full_svd=full_svd)
+        with torch.no_grad():
+            merged = (
+                pissa_linear.weight
+                + (pissa_linear.pissa_v_weight * pissa_linear.pissa_s)
+                @ pissa_linear.pissa_u_weight
+            )
+        torch.testing.assert_close(merged, base_weight, atol=1e-5, rtol=1e-5)
+
+    def test_initialize_pissa_preserves_outputs(self, inputs, pissa_linear) -> None:
+        # ALPHA != RANK, so any alpha / rank scaling in the forward breaks this
+        pissa_linear = pissa_linear(initialize_pissa=False)
+        # pissa_s is zero-initialized, so this is just the base projection
+        expected = pissa_linear(inputs)
+        pissa_linear.initialize_pissa()
+        actual = pissa_linear(inputs)
+        torch.testing.assert_close(actual, expected, atol=1e-5, rtol=1e-5)
+
+    def test_initialize_pissa_raises_with_full_svd_and_fsvd_niter(
+        self, pissa_linear
+    ) -> None:
+        pissa_linear = pissa_linear(initialize_pissa=False)
+        with pytest.raises(ValueError, match="cannot be set together"):
+            pissa_linear.initialize_pissa(RANK, full_svd=True)
+
+    @pytest.mark.parametrize("use_bias", [True, False])
+    @pytest.mark.parametrize("merge_in_eval", [True, False])
+    def test_train_eval_parity(
+        self, inputs, pissa_linear, use_bias, merge_in_eval
+    ) -> None:
+        pissa_linear = pissa_linear(use_bias=use_bias, merge_in_eval=merge_in_eval)
+        train_out = pissa_linear(inputs)
+        pissa_linear.eval()
+        with torch.no_grad():
+            eval_out = pissa_linear(inputs)
+        assert (pissa_linear._merged_weight is not None) == merge_in_eval
+        torch.testing.assert_close(eval_out, train_out, atol=1e-5, rtol=1e-5)
+
+        pissa_linear.train()
+        assert pissa_linear._merged_weight is None
+
+    @pytest.mark.parametrize("use_bias", [True, False])
+    @pytest.mark.parametrize("merge_in_eval", [True, False])
+    def test_qpissa_train_eval_parity(
+        self, qpissa_linear, use_bias, merge_in_eval
+    ) -> None:
+        qpissa_linear = qpissa_linear(use_bias=use_bias, merge_in_eval=merge_in_eval)
+        assert isinstance(qpissa_linear.weight, NF4Tensor)
+        inputs = torch.randn(BSZ, SEQ_LEN, 512)
+        train_out = qpissa_linear(inputs)
+        qpissa_linear.eval()
+        with torch.no_grad():
+            eval_out = qpissa_linear(inputs)
+        # The dense merged weight is only built when explicitly requested
+        assert (qpissa_linear._merged_weight is not None) == merge_in_eval
+        assert isinstance(qpissa_linear.weight, NF4Tensor)
+        torch.testing.assert_close(eval_out, train_out, atol=1e-5, rtol=1e-5)
+
+    def test_eval_with_grad_enabled_trains_adapter(self, inputs, pissa_linear) -> None:
+        pissa_linear = pissa_linear(merge_in_eval=True)
+        pissa_linear.eval()
+        pissa_linear(inputs).sum().backward()
+        assert pissa_linear._merged_weight is None
+        for param in get_adapter_params(pissa_linear).values():
+            assert param.grad is not None
+
+    def test_merged_weight_invalidated_after_inplace_update(
+        self, inputs, pissa_linear
+    ) -> None:
+        pissa_linear = pissa_linear(merge_in_eval=True)
+        pissa_linear.eval()
+        with torch.no_grad():
+            pissa_linear(inputs)
+            pissa_linear.pissa_s.add_(1.0)
+            actual = pissa_linear(inputs)
+            expected = _reference_forward(pissa_linear, inputs)
+        torch.testing.assert_close(actual, expected, atol=1e-5, rtol=1e-5)
+
+    def test_merged_weight_invalidated_after_to(self, inputs, pissa_linear) -> None:
+        pissa_linear = pissa_linear(merge_in_eval=True)
+        pissa_linear.eval()
+        with torch.no_grad():
+            pissa_linear(inputs)
+            pissa_linear.to(torch.float64)
+            assert pissa_linear._merged_weight is None
+            inputs = inputs.to(torch.float64)
+            actual = pissa_linear(inputs)
+            expected = _reference_forward(pissa_linear, inputs)
+        assert actual.dtype == torch.float64
+        torch.testing.assert_close(actual, expected)
+
+    def test_disabled_toggle(self, inputs, pissa_linear) -> None:
+        pissa_linear = pissa_linear()
+        with torch.no_grad():
+            pissa_linear.pissa_s.add_(1.0)
+        base_out = F.linear(inputs, pissa_linear.weight, pissa_linear.bias)
+        expected = _reference_forward(pissa_linear, inputs)
+
+        pissa_linear.disabled = True
+        assert "forward" in pissa_linear.__dict__
+        torch.testing.assert_close(pissa_linear(inputs), base_out)
+
+        pissa_linear.disabled = False
+        assert "forward" not in pissa_linear.__dict__
+        torch.testing.assert_close(pissa_linear(inputs), expected)
+
+        with disable_adapter(pissa_linear):
+            assert pissa_linear.disabled
+            torch.testing.assert_close(pissa_linear(inputs), base_out)
+        assert not pissa_linear.disabled
+        torch.testing.assert_close(pissa_linear(inputs), expected)
+
+    def test_freed_without_gc(self, pissa_linear) -> None:
+        # The module shouldn't hold references to itself, so that dropping
+        # it frees its weights without waiting for the cyclic collector
+        pissa_linear = pissa_linear()
+        pissa_linear.disabled = True
+        pissa_linear.disabled = False
+        ref = weakref.ref(pissa_linear)
+        del pissa_linear
+        assert ref() is None
+
+    def test_to_empty_and_initialize_parameters(self, in_dim, out_dim) -> None:
+        with torch.device("meta"):
+            pissa_linear = PiSSALinear(
+                in_dim=in_dim, out_dim=out_dim, rank=RANK, alpha=ALPHA
+            )
+        pissa_linear.pissa_s.requires_grad_(False)
+        params = get_adapter_params(pissa_linear)
+
+        pissa_linear.to_empty(device="cpu")
+        pissa_linear.initialize_parameters()
+
+        for name, param in get_adapter_params(pissa_linear).items():
+            assert param is params[name]
+            assert param.device == torch.device("cpu")
+        assert not pissa_linear.pissa_s.requires_grad
+        assert pissa_linear.pissa_u_weight.requires_grad
+        torch.testing.assert_close(
+            pissa_linear.pissa_s, torch.zeros_like(pissa_linear.pissa_s)
+        )
+
+    def test_adapter_params(self, pissa_linear) -> None:
+        pissa_linear = pissa_linear()
+        assert set(get_adapter_params(pissa_linear).keys()) == {
+            "pissa_u_weight",
+            "pissa_s",
+            "pissa_v_weight",
+        }
+
+    def test_load_legacy_state_dict(self, inputs, pissa_linear) -> None:
+        pissa_linear = pissa_linear()
+        state_dict = pissa_linear.state_dict()
+        legacy_state_dict = {
+            "weight": state_dict["weight"],
+            "bias": state_dict["bias"],
+            "pissa_u.weight": state_dict["pissa_u_weight"],
+            "pissa_s": state_dict["pissa_s"] / (ALPHA / RANK),
+            "pissa_v.weight": state_dict["pissa_v_weight"],
+        }
+
+        pissa_linear_reload = PiSSALinear(
+            in_dim=pissa_linear.in_dim,
+            out_dim=pissa_linear.out_dim,
+            rank=RANK,
+            alpha=ALPHA,
+            use_bias=True,
+        )
+        pissa_linear_reload.load_state_dict(legacy_state_dict)
+        for k, v in state_dict.items():
+            torch.testing.assert_close(pissa_linear_reload.state_dict()[k], v)
+        torch.testing.assert_close(pissa_linear_reload(inputs), pissa_linear(inputs))
+
+    def test_mismatched_input_dtype_is_cast(self, inputs, pissa_linear) -> None:
+        pissa_linear = pissa_linear()
+        expected = pissa_linear(inputs)
+        actual = pissa_linear(inputs.to(torch.float64))
+        assert actual.dtype == torch.float32
+        torch.testing.assert_close(actual, expected)
+
+    def test_input_is_not_cast_under_cpu_autocast(self, inputs, pissa_linear) -> None:
+        pissa_linear = pissa_linear()
+        inputs = inputs.to(torch.float64)
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            assert pissa_linear._cast_input(inputs) is inputs
+            assert pissa_linear(inputs).dtype == torch.bfloat16
+
+    @pytest.mark.skipif(not _torchao_0_7_supported, reason="needs torchao 0.7+")
+    def test_qat_pissa_forward_without_adapter_fake_quant(
+        self, inputs, pissa_linear
+    ) -> None:
+        pissa_linear = pissa_linear(use_bias=False)
+        qat_pissa_linear = QATPiSSALinear.from_lora_linear(pissa_linear)
+        assert isinstance(qat_pissa_linear.pissa_u_fake_quantizer, torch.nn.Identity)
+        assert isinstance(qat_pissa_linear.pissa_v_fake_quantizer, torch.nn.Identity)
+        torch.testing.assert_close(qat_pissa_linear(inputs), pissa_linear(inputs))
+
+    @pytest.mark.skipif(not _torchao_0_7_supported, reason="needs torchao 0.7+")
+    def test_qat_pissa_forward_with_adapter_fake_quant(
+        self, inputs, pissa_linear
+    ) -> None:
+        from torchao.quantization.qat.api import FakeQuantizeConfig
+        from torchao.quantization.qat.fake_quantizer import FakeQuantizer
+
+        adapter_qat_config = FakeQuantizeConfig(
+            dtype=torch.int8, group_size=RANK, is_symmetric=True
+        )
+        pissa_linear = pissa_linear(use_bias=False)
+        qat_pissa_linear = QATPiSSALinear.from_lora_linear(
+            pissa_linear, adapter_qat_config=adapter_qat_config
+        )
+        assert isinstance(qat_pissa_linear.pissa_u_fake_quantizer, FakeQuantizer)
+        assert isinstance(qat_pissa_linear.pissa_v_fake_quantizer, FakeQuantizer)
+
+        # Compare against manually fake quantized adapter weights
+        u_fq = FakeQuantizer(adapter_qat_config)
+        v_fq = FakeQuantizer(adapter_qat_config)
+        lora_out = F.linear(inputs, u_fq(pissa_linear.pissa_u_weight))
+        lora_out = F.linear(
+            lora_out * pissa_linear.pissa_s, v_fq(pissa_linear.pissa_v_weight)
+        )
+        expected = F.linear(inputs, pissa_linear.weight) + lora_out
+        qat_out = qat_pissa_linear(inputs)
+        torch.testing.assert_close(qat_out, expected)
+
+        qat_out.sum().backward()
+        for param in get_adapter_params(qat_pissa_linear).values():
+            assert param.grad is not None
+
+    @pytest.mark.skipif(not _torchao_0_7_supported, reason="needs torchao 0.7+")
+    @pytest.mark.parametrize("use_adapter_qat", [True, False])
+    def test_qat_pissa_train_eval_parity(
+        self, inputs, pissa_linear, use_adapter_qat
+    ) -> None:
+        from torchao.quantization.qat.api import FakeQuantizeConfig
+
+        adapter_qat_config = (
+            FakeQuantizeConfig(dtype=torch.int8, group_size=RANK, is_symmetric=True)
+            if use_adapter_qat
+            else None
+        )
+        pissa_linear = pissa_linear(use_bias=False)
+        qat_pissa_linear = QATPiSSALinear.from_lora_linear(
+            pissa_linear, adapter_qat_config=adapter_qat_config
+        )
+        train_out = qat_pissa_linear(inputs)
+        qat_pissa_linear.eval()
+        with torch.no_grad():
+            eval_out = qat_pissa_linear(inputs)
+        assert qat_pissa_linear._scaled_pissa_v is not None
+        torch.testing.assert_close(eval_out, train_out, atol=1e-5, rtol=1e-5)
+
+        qat_pissa_linear.train()
+        assert qat_pissa_linear._scaled_pissa_v is None
+
+    @pytest.mark.skipif(not _torchao_0_7_supported, reason="needs torchao 0.7+")
+    def test_qat_pissa_eval_cache_invalidation(self, inputs, pissa_linear) -> None:
+        from torchao.quantization.qat.api import FakeQuantizeConfig
+
+        adapter_qat_config = FakeQuantizeConfig(
+            dtype=torch.int8, group_size=RANK, is_symmetric=True
+        )
+        pissa_linear = pissa_linear(use_bias=False)
+        qat_pissa_linear = QATPiSSALinear.from_lora_linear(
+            pissa_linear, adapter_qat_config=adapter_qat_config
+        )
+        qat_pissa_linear.eval()
+        with torch.no_grad():
+            qat_pissa_linear(inputs)
+            qat_pissa_linear.to("cpu")
+            assert qat_pissa_linear._scaled_pissa_v is None
+
+            qat_pissa_linear(inputs)
+            qat_pissa_linear.pissa_v_fake_quantizer.enabled = False
+            actual = qat_pissa_linear(inputs)
+            pissa_u = qat_pissa_linear.pissa_u_fake_quantizer(
+                qat_pissa_linear.pissa_u_weight
+            )
+            lora_out = F.linear(inputs, pissa_u) * qat_pissa_linear.pissa_s
+            expected = F.linear(inputs, qat_pissa_linear.weight) + F.linear(
+                lora_out, qat_pissa_linear.pissa_v_weight
+            )
+        torch.testing.assert_close(actual, expected, atol=1e-5, rtol=1e-5)
+
+    @pytest.mark.skipif(not _torchao_0_7_supported, reason="needs torchao 0.7+")
+    def test_qat_pissa_eval_with_grad_enabled_trains_adapter(
+        self, inputs, pissa_linear
+    ) -> None:
+        pissa_linear = pissa_linear(use_bias=False)
+        qat_pissa_linear = QATPiSSALinear.from_lora_linear(pissa_linear)
+        qat_pissa_linear.eval()
+        qat_pissa_linear(inputs).sum().backward()
+        assert qat_pissa_linear._scaled_pissa_v is None
+        assert qat_pissa_linear.pissa_s.grad is not None
+        assert qat_pissa_linear.pissa_v_weight.grad is not None
+
+    @pytest.mark.skipif(not _torchao_0_7_supported, reason="needs torchao 0.7+")
+    def test_qat_pissa_adapter_group_size_must_divide_rank(
+        self, in_dim, out_dim
+    ) -> None:
+        from torchao.quantization.qat.api import FakeQuantizeConfig
+
+        adapter_qat_config = FakeQuantizeConfig(
+            dtype=torch.int8, group_size=2 * RANK, is_symmetric=True
+        )
+        with pytest.raises(ValueError, match="must be divisible by group_size"):
+            QATPiSSALinear(
+                in_dim=in_dim,
+                out_dim=out_dim,
+                rank=RANK,
+                alpha=ALPHA,
+                adapter_qat_config=adapter_qat_config,
+            )
+
+    @pytest.mark.skipif(not _torchao_0_7_supported, reason="needs torchao 0.7+")
+    def test_qat_pissa_from_lora_linear_preserves_adapter(self, pissa_linear) -> None:
+        pissa_linear = pissa_linear(use_bias=False)
+        qat_pissa_linear = QATPiSSALinear.from_lora_linear(pissa_linear)
+        qat_state_dict = qat_pissa_linear.state_dict()
+        for k, v in pissa_linear.state_dict().items():
+            assert torch.equal(qat_state_dict[k], v)
+        assert not torch.equal(
+            qat_pissa_linear.pissa_s, torch.zeros_like(qat_pissa_linear.pissa_s)
+        )
@@ -19,6 +19,7 @@ from torchtune.modules.peft import (
     get_adapter_state_dict,
     get_merged_lora_ckpt,
     LoRALinear,
+    PiSSALinear,
     set_trainable_params,
     validate_missing_and_unexpected_for_lora,
 )
@@ -436,6 +437,21 @@ class TestGetMergedLoRACkpt:
         model[0].weight = nn.Parameter(3 * torch.ones((6, 4)))
         return model
 
+    def dummy_pissa_model(self):
+        model = nn.Sequential(
+            PiSSALinear(in_dim=4, out_dim=6, rank=RANK, alpha=ALPHA),
+            nn.Linear(6, 3),
+        )
+        model[0].pissa_u_weight = nn.Parameter(
+            torch.Tensor([[1, 2, 3, 4], [5, 6, 7, 8]])
+        )
+        model[0].pissa_s = nn.Parameter(torch.Tensor([1, 2]))
+        model[0].pissa_v_weight = nn.Parameter(
+            torch.Tensor([[1, 2], [3, 4], [5, 6], [7, 8], [9, 10], [11, 12]])
+        )
+        model[0].weight = nn.Parameter(3 * torch.ones((6, 4)))
+        return model
+
     @pytest.mark.parametrize("use_dora", [True, False])
     def test_get_merged_lora_ckpt(self, use_dora):
         if use_dora:
@@ -480,6 +496,31 @@ class TestGetMergedLoRACkpt:
         inputs = torch.randn(2, 8, 4)
         torch.testing.assert_close(dummy_model(inputs), merged_model(inputs))
 
+    def test_get_merged_pissa_ckpt(self):
+        dummy_model = self.dummy_pissa_model()
+        merged_sd = get_merged_lora_ckpt(
+            deepcopy(dummy_model.state_dict()), rank=RANK, alpha=ALPHA
+        )
+        # The PiSSA merge does not rescale the adapter by alpha / rank
+        expected_merged_weight = torch.Tensor(
+            [
+                [24.0, 29.0, 34.0, 39.0],
+                [46.0, 57.0, 68.0, 79.0],
+                [68.0, 85.0, 102.0, 119.0],
+                [90.0, 113.0, 136.0, 159.0],
+                [112.0, 141.0, 170.0, 199.0],
+                [134.0, 169.0, 204.0, 239.0],
+            ]
+        )
+        assert merged_sd.keys() == {"0.weight", "1.weight", "1.bias"}
+        torch.testing.assert_close(merged_sd["0.weight"], expected_merged_weight)
+
+        merged_model = nn.Sequential(nn.Linear(4, 6, bias=False), nn.Linear(6, 3))
+        merged_model.load_state_dict(merged_sd, strict=True)
+
+        inputs = torch.randn(2, 8, 4)
+        torch.testing.assert_close(dummy_model(inputs), merged_model(inputs))
+
 
 class TestDisableAdapter:
     def dummy_model(self):
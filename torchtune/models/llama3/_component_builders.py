@@ -207,6 +207,7 @@ def lora_llama3(
             introduced in "DoRA: Weight-Decomposed Low-Rank Adaptation" (https://arxiv.org/abs/2402.09353).
         pissa_config (bool): Initialize the LoRA weight with the principal singular values and singular vectors, as
             introduced in "PiSSA: Principal Singular Values and Singular Vectors Adaptation" (https://arxiv.org/abs/2404.02948).
+            Its ``merge_in_eval`` key is passed on to :class:`~torchtune.modules.peft.PiSSALinear`.
         quantize_base: (bool): Whether to quantize base model weights or not. Only applied to base
             weights within linear layers LoRA is applied to. The final output linear projection is not
             supported for quantization currently.
@@ -263,7 +264,9 @@ def lora_llama3(
 
     # TODO: quantize_base is not applied to final output_proj currently.
     if pissa_config is not None:
-        adapter_cls = PiSSALinear
+        adapter_cls = partial(
+            PiSSALinear, merge_in_eval=pissa_config.get("merge_in_eval", False)
+        )
     elif use_dora:
         adapter_cls = DoRALinear
     else:
@@ -344,6 +347,7 @@ def lora_llama3_self_attention(
             introduced in "DoRA: Weight-Decomposed Low-Rank Adaptation" (https://arxiv.org/abs/2402.09353).
         pissa_config (dict): Initialize the LoRA weight with the principal singular values and singular vectors, as
             introduced in "PiSSA: Principal Singular Values and Singular Vectors Adaptation" (https://arxiv.org/abs/2404.02948).
+            Its ``merge_in_eval`` key is passed on to :class:`~torchtune.modules.peft.PiSSALinear`.
 
     Returns:
         MultiHeadAttention: instantiation of self-attention module with LoRA
@@ -360,7 +364,9 @@ def lora_llama3_self_attention(
     head_dim = embed_dim // num_heads
     num_kv_heads = num_kv_heads if num_kv_heads else num_heads
     if pissa_config is not None:
-        adapter_cls = PiSSALinear
+        adapter_cls = partial(
+            PiSSALinear, merge_in_eval=pissa_config.get("merge_in_eval", False)
+        )
     elif use_dora:
         adapter_cls = DoRALinear
     else:
@@ -461,7 +467,9 @@ def lora_llama3_mlp(
     pissa_config: dict = None,
 ) -> FeedForward:
     if pissa_config:
-        adapter_cls = PiSSALinear
+        adapter_cls = partial(
+            PiSSALinear, merge_in_eval=pissa_config.get("merge_in_eval", False)
+        )
     elif use_dora:
         adapter_cls = DoRALinear
     else:
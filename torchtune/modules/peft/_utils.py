@@ -150,9 +150,9 @@ def _get_lora_modules(state_dict: Dict[str, Any]) -> Set[str]:
         [
             k.replace(".lora_a.weight", "")
             .replace(".lora_b.weight", "")
-            .replace(".pissa_u.weight", "")
+            .replace(".pissa_u_weight", "")
             .replace(".pissa_s", "")
-            .replace(".pissa_v.weight", "")
+            .replace(".pissa_v_weight", "")
             .replace(".magnitude", "")
             for k in lora_keys
         ]
@@ -183,19 +183,20 @@ def get_merged_lora_ckpt(
     """
     lora_modules = _get_lora_modules(state_dict)
     for module in lora_modules:
-        pissa_u_weight = state_dict.get(f"{module}.pissa_u.weight", None)
+        pissa_u_weight = state_dict.get(f"{module}.pissa_u_weight", None)
         pissa_s = state_dict.get(f"{module}.pissa_s", None)
-        pissa_v_weight = state_dict.get(f"{module}.pissa_v.weight", None)
+        pissa_v_weight = state_dict.get(f"{module}.pissa_v_weight", None)
         lora_a_weight = state_dict.get(f"{module}.lora_a.weight", None)
         lora_b_weight = state_dict.get(f"{module}.lora_b.weight", None)
         lora_magnitude = state_dict.get(f"{module}.magnitude", None)
 
         # If pissa is present, calculate merged PiSSA weight
         if pissa_s is not None:
-            state_dict[f"{module}.weight"] += (alpha / rank) * pissa_v_weight @ torch.diag(pissa_s) @ pissa_u_weight
-            del state_dict[f"{module}.pissa_u.weight"]
+            # pissa_s holds the raw singular values, alpha is unused by PiSSA
+            state_dict[f"{module}.weight"] += (pissa_v_weight * pissa_s) @ pissa_u_weight
+            del state_dict[f"{module}.pissa_u_weight"]
             del state_dict[f"{module}.pissa_s"]
-            del state_dict[f"{module}.pissa_v.weight"]
+            del state_dict[f"{module}.pissa_v_weight"]
             
         # If magnitude is present, calculate merged DoRA weight
         elif lora_magnitude is not None:
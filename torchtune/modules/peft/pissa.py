@@ -3,17 +3,27 @@
 #
 # This source code is licensed under the BSD-style license found in the
 # LICENSE file in the root directory of this source tree.
+import logging
 import math
-from typing import List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import torch
 import torch.nn.functional as F
 
 from torch import nn
+from torch.distributed._tensor import DTensor
+from torch.utils._python_dispatch import is_traceable_wrapper_subclass
 
 from torchao.dtypes.nf4tensor import linear_nf4, to_nf4
 from torchtune.modules.low_precision import _register_nf4_dispatch_ops  # noqa: F401
 from torchtune.modules.peft import AdapterModule
+from torchtune.utils._logging import get_logger, log_once
+from torchtune.utils._version import torch_version_ge
+
+_log: logging.Logger = get_logger()
+
+# Extra directions sampled by the randomized SVD in ``PiSSALinear.initialize_pissa``
+_FSVD_OVERSAMPLES = 10
 
 
 class PiSSALinear(nn.Module, AdapterModule):
@@ -22,21 +32,39 @@ class PiSSALinear(nn.Module, AdapterModule):
     PiSSA perturbs a given layer via a low-rank approximation where only
     the rank decomposition matrices are trainable. In a linear layer instead of
     :math:`x \\mapsto W_0x` a PiSSALinear layer is defined as
-    :math:`x \\mapsto W_0x + (\\alpha / r)BAx`, where :math:`r` is the rank of
-    the matrices :math:`A` and :math:`B` and :math:`\\alpha` is a scaling factor.
+    :math:`x \\mapsto W^{res}x + V \\text{diag}(s) Ux`, where :math:`V`, :math:`s`
+    and :math:`U` are initialized to the top :math:`r` singular vectors and values
+    of :math:`W_0` and :math:`W^{res} = W_0 - V \\text{diag}(s) U` is the frozen residual.
     As in the original implementation, we support dropout before multiplication
     by the low-rank matrices.
 
+    ``pissa_s`` stores the singular values as they are, without any
+    :math:`\\alpha / r` scaling, so ``alpha`` has no effect on PiSSA.
+
+    If ``merge_in_eval`` is set, in eval mode with gradients disabled the adapter is
+    folded into the base weight, so that the layer is applied with a single matmul.
+    The merged weight is cached until the base or adapter parameters change and is
+    freed when switching back to train mode. The cache is a second dense
+    ``[out_dim, in_dim]`` weight that is kept for as long as the layer stays in eval,
+    roughly doubling the weight memory. With ``quantize_base=True`` it also gives up
+    the memory savings of NF4, and under FSDP it holds the unsharded weight on every
+    rank, which undoes the sharding.
+
     Args:
         in_dim (int): input dimension
         out_dim (int): output dimension
         rank (int): rank of the low-rank approximation
-        alpha (float): scaling factor for the low-rank approximation
+        alpha (float): unused by PiSSA, kept for signature compatibility with
+            :class:`~torchtune.modules.peft.LoRALinear`. Only used to rescale ``pissa_s``
+            when loading adapter checkpoints saved before ``pissa_s`` dropped the scaling.
         dropout (float): dropout probability. Default: 0.0
         use_bias (bool): whether to include bias in the original linear layer.
             Default: False
         quantize_base (bool): Whether to quantize base linear weight or not.
             Default: False
+        merge_in_eval (bool): Whether to merge the adapter into a cached copy of the
+            base weight in eval mode. This trades a dense copy of every adapted weight
+            for a single matmul per forward, see above. Default: False
         **quantization_kwargs: Keyword arguments to pass to `to_nf4` when quantizing the base linear weight.
             Examples of valid arguments are `block_size` and `scaler_block_size`, which control the granularity of
             weight quantization and scaler quantization respectively. This is only used if `quantize_base` is True.
@@ -55,6 +83,7 @@ class PiSSALinear(nn.Module, AdapterModule):
         dropout: float = 0.0,
         use_bias: bool = False,
         quantize_base: bool = False,
+        merge_in_eval: bool = False,
         **quantization_kwargs,
     ):
         super().__init__()
@@ -64,8 +93,9 @@ class PiSSALinear(nn.Module, AdapterModule):
         self.alpha = alpha
         self.use_bias = use_bias
         self._quantize_base = quantize_base
+        self._merge_in_eval = merge_in_eval
 
-        if not self._quantize_base and any([v for v in quantization_kwargs.values()]):
+        if not self._quantize_base and any(quantization_kwargs.values()):
             raise ValueError(
                 f"``quantize_base`` is False, but received the following quantization arguments: {quantization_kwargs}"
             )
@@ -84,90 +114,215 @@ class PiSSALinear(nn.Module, AdapterModule):
         # and disabling it to treat the base model as the reference model
         self.disabled = False
         self.register_parameter("weight", nn.Parameter(weight))
-        self.register_parameter(
-            "bias", nn.Parameter(bias) if bias is not None else None
-        )
-        self.dropout = nn.Dropout(p=dropout) if dropout > 0.0 else nn.Identity()
-        self.pissa_u = nn.Linear(in_features=in_dim, out_features=rank, bias=False)
-        self.pissa_s = nn.Parameter(torch.zeros(rank))
-        self.pissa_v = nn.Linear(in_features=rank, out_features=out_dim, bias=False)
+        if bias is not None:
+            self.bias = nn.Parameter(bias)
+        else:
+            self.register_parameter("bias", None)
+        # Dropout is applied functionally to avoid a module call in the hot path
+        self._dropout_p = dropout
+        # The adapter weights are stored as raw parameters and applied with F.linear
+        # to avoid the overhead of two nn.Linear submodule calls per forward
+        self.pissa_u_weight = nn.Parameter(torch.empty(rank, in_dim))
+        # pissa_s is zeroed in initialize_parameters
+        self.pissa_s = nn.Parameter(torch.empty(rank))
+        self.pissa_v_weight = nn.Parameter(torch.empty(out_dim, rank))
         self.merged = False
+        # Cache for the eval-mode merged weight, see ``_get_merged_weight``
+        self._merged_weight: Optional[torch.Tensor] = None
+        self._merged_weight_key: Optional[Tuple[Tuple[Any, ...], ...]] = None
         self.initialize_parameters()
+        # Register the unbound hook so the module doesn't hold a reference to itself
+        self._register_load_state_dict_pre_hook(
+            PiSSALinear._load_state_dict_hook, with_module=True
+        )
 
     def to_empty(
         self, *, device: Optional[Union[str, torch.device, int]], recurse: bool = True
     ):
-        self.pissa_u.to_empty(device=device, recurse=recurse)
-        pissa_s = nn.Parameter(
-            torch.empty_like(self.pissa_s, device=device),
-            requires_grad=self.pissa_s.requires_grad,
-        )
-        torch.utils.swap_tensors(self.pissa_s, pissa_s)
-        self.pissa_v.to_empty(device=device, recurse=recurse)
+        for param in (self.pissa_u_weight, self.pissa_s, self.pissa_v_weight):
+            data = torch.empty_like(param.data, device=device)
+            if is_traceable_wrapper_subclass(data):
+                # Tensor subclasses such as the DTensors created by FSDP sharding
+                # don't support ``.data`` assignment and have to be swapped
+                new_param = nn.Parameter(data, requires_grad=param.requires_grad)
+                torch.utils.swap_tensors(param, new_param)
+            else:
+                param.data = data
+
+    def _load_state_dict_hook(
+        self,
+        state_dict: Dict[str, Any],
+        prefix: str,
+        *args: Tuple[Any],
+        **kwargs: Dict[str, Any],
+    ) -> None:
+        """
+        Migrate legacy PiSSA adapter checkpoints, which stored U and V as
+        ``pissa_u.weight`` and ``pissa_v.weight`` and divided ``pissa_s`` by
+        ``alpha / rank``, to the current layout.
+
+        Args:
+            state_dict (Dict[str, Any]): The state dict to load.
+            prefix (str): The prefix of the state dict.
+            *args (Tuple[Any]): Additional positional arguments.
+            **kwargs (Dict[str, Any]): Additional keyword arguments.
+        """
+        legacy_keys = {
+            f"{prefix}pissa_u.weight": f"{prefix}pissa_u_weight",
+            f"{prefix}pissa_v.weight": f"{prefix}pissa_v_weight",
+        }
+        if not any(k in state_dict for k in legacy_keys):
+            return
+        for legacy_key, key in legacy_keys.items():
+            if legacy_key in state_dict:
+                state_dict[key] = state_dict.pop(legacy_key)
+        if f"{prefix}pissa_s" in state_dict:
+            state_dict[f"{prefix}pissa_s"] = state_dict[f"{prefix}pissa_s"] * (
+                self.alpha / self.rank
+            )
 
     def initialize_parameters(self):
         # Initialize as in
         # https://github.com/microsoft/PiSSA/blob/4c0333854cb905966f8cc4e9a74068c1e507c7b7/loralib/layers.py#L119
-        _pissa_u_init_params(self.pissa_u)
+        _pissa_u_init_params(self.pissa_u_weight)
         _pissa_s_init_params(self.pissa_s)
-        _pissa_v_init_params(self.pissa_v)
+        _pissa_v_init_params(self.pissa_v_weight)
 
     @torch.no_grad()
-    def initialize_pissa(self, fsvd_niter=None):
+    def initialize_pissa(self, fsvd_niter: Optional[int] = None, full_svd: bool = False):
         """
-        PiSSA initializes the magnitude vector such that its outputs are initially
-        identical to standard LoRA's outputs.
+        PiSSA initializes the adapter to the top ``rank`` singular vectors and values
+        of the base weight and replaces the base weight with the residual, so that
+        the layer's outputs are initially unchanged.
 
         This must be called after loading/initializing base model and LoRA params.
 
+        Args:
+            fsvd_niter (Optional[int]): number of subspace iterations of the fast SVD.
+                If None, an oversampled randomized SVD with 2 iterations is used, falling
+                back to the full SVD for small or DTensor weights. Default: None
+            full_svd (bool): Whether to use the exact full SVD instead of a randomized
+                one. Cannot be combined with ``fsvd_niter``. Default: False
+
         Raises:
             RuntimeError: If base or LoRA parameters are still on meta device.
+            RuntimeError: If ``fsvd_niter`` is not a non-negative integer.
+            ValueError: If both ``fsvd_niter`` and ``full_svd`` are set.
         """
         if any(
-            [
-                self.weight.is_meta,
-                self.pissa_u.weight.is_meta,
-                self.pissa_s.is_meta,
-                self.pissa_v.weight.is_meta,
-            ]
+            p.is_meta
+            for p in (
+                self.weight,
+                self.pissa_u_weight,
+                self.pissa_s,
+                self.pissa_v_weight,
+            )
         ):
             raise RuntimeError(
                 "Cannot initialize PiSSA if base or LoRA parameters are still on meta device."
             )
+        if full_svd and fsvd_niter is not None:
+            raise ValueError("``full_svd`` cannot be set together with ``fsvd_niter``.")
         dtype =  self.weight.dtype
         base_weight = self.weight.to(torch.float32)
         if fsvd_niter is not None:
             if isinstance(fsvd_niter, int) and fsvd_niter >= 0:
                 Vr, Sr, Ur = torch.svd_lowrank(base_weight, self.rank, niter=fsvd_niter)
-                Sr /= self.alpha / self.rank
                 Uhr = Ur.t()
             else:
                 raise RuntimeError(
-                    "Fast SVD niter is a non-negative integer. It is recommended to set it equal to the rank."
+                    "Fast SVD niter must be a non-negative integer, or None to use the default "
+                    "randomized SVD with niter=2. Set ``full_svd=True`` for the exact SVD."
                 )
-        else:
+        elif (
+            full_svd
+            or isinstance(base_weight, DTensor)
+            or self.rank + _FSVD_OVERSAMPLES >= min(base_weight.shape)
+        ):
+            # Fast SVD conflicts with DTensor, and small weights gain nothing from it
             V, S, Uh = torch.linalg.svd(base_weight, full_matrices=False)
+            # Copy out the top ``rank`` triplets so the weight-sized factors can be freed
+            Vr = V[:, : self.rank].clone()
+            Sr = S[: self.rank].clone()
+            Uhr = Uh[: self.rank].clone()
+            del V, S, Uh
+        else:
+            # Only the top ``rank`` singular triplets are kept, so an oversampled
+            # randomized SVD is much cheaper than the full decomposition
+            V, S, U = torch.svd_lowrank(
+                base_weight, q=self.rank + _FSVD_OVERSAMPLES, niter=2
+            )
             Vr = V[:, : self.rank]
             Sr = S[: self.rank]
-            Sr /= self.alpha / self.rank
-            Uhr = Uh[: self.rank]
-        
-        self.pissa_u.weight.copy_(Uhr)
+            Uhr = U[:, : self.rank].t()
+
+        self.pissa_u_weight.copy_(Uhr)
         self.pissa_s.copy_(Sr)
-        self.pissa_v.weight.copy_(Vr)
-        residual_weight = base_weight - Vr @ torch.diag(Sr) @ Uhr
+        self.pissa_v_weight.copy_(Vr)
+        # Subtract the principal components in place to avoid allocating
+        # another weight-sized fp32 tensor
+        residual_weight = base_weight.addmm_(Vr * Sr, Uhr, alpha=-1)
         self.weight.copy_(residual_weight.to(dtype))
         
+    @property
+    def disabled(self) -> bool:
+        return self._disabled
+
+    @disabled.setter
+    def disabled(self, disabled: bool) -> None:
+        # Rebind forward to the base projection while disabled, so that the
+        # enabled forward doesn't need to check the flag on every call
+        self._disabled = disabled
+        if disabled:
+            self.forward = self._disabled_forward
+        else:
+            self.__dict__.pop("forward", None)
+
+    def train(self, mode: bool = True) -> "PiSSALinear":
+        # The eval caches are only used in eval mode
+        if mode:
+            self._clear_eval_caches()
+        return super().train(mode)
+
+    def _apply(self, fn, *args, **kwargs):
+        # Module.to() and friends move params via ``param.data``, which keeps their
+        # identity and version counter, so the eval caches must be dropped here
+        self._clear_eval_caches()
+        return super()._apply(fn, *args, **kwargs)
+
+    def _clear_eval_caches(self) -> None:
+        self._merged_weight = None
+        self._merged_weight_key = None
+
+    @torch.no_grad()
+    def _get_merged_weight(self) -> torch.Tensor:
+        """
+        Return ``weight + V @ diag(s) @ U``, recomputing it only if one of
+        the underlying parameters has been replaced or modified in place since the
+        last call.
+        """
+        key = _param_versions(
+            self.weight, self.pissa_u_weight, self.pissa_s, self.pissa_v_weight
+        )
+        if self._merged_weight is None or key != self._merged_weight_key:
+            weight = self.weight
+            if self._quantize_base:
+                weight = weight.to(self.pissa_u_weight.dtype)
+            scaled_v = self.pissa_v_weight * self.pissa_s
+            self._merged_weight = weight + scaled_v @ self.pissa_u_weight
+            self._merged_weight_key = key
+        return self._merged_weight
+
     def adapter_params(self) -> List[str]:
         """
         Return a list of strings corresponding to the names of the ``nn.Parameter`` s in
         the model coming from the adapter.
 
-        For PiSSA this means pissa_u.weight, pissa_s and pissa_v.weight.
+        For PiSSA this means pissa_u_weight, pissa_s and pissa_v_weight.
         """
-        # NOTE: this function has to be updated if the names of "pissa_u" and "pissa_v"
-        # in this module change.
-        adapter_params = ["pissa_u.weight", "pissa_s", "pissa_v.weight"]
+        # NOTE: this function has to be updated if the names of "pissa_u_weight",
+        # "pissa_s" and "pissa_v_weight" in this module change.
+        adapter_params = ["pissa_u_weight", "pissa_s", "pissa_v_weight"]
         return adapter_params
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:
@@ -179,19 +334,51 @@ class PiSSALinear(nn.Module, AdapterModule):
             torch.Tensor: output tensor with shape ``(..., out_dim)``
 
         """
-        if self._quantize_base:
-            out = linear_nf4(input=x, weight=self.weight)
-            if self.use_bias:
-                out = out + self.bias
-        else:
-            out = F.linear(x, self.weight, self.bias)
-        if self.disabled:
-            return out
-        lora_out = self.pissa_u(self.dropout(x))
-        lora_out = lora_out * self.pissa_s * (self.alpha / self.rank)
-        lora_out = self.pissa_v(lora_out)
+        x = self._cast_input(x)
+        if self._merge_in_eval and not self.training and not torch.is_grad_enabled():
+            # Dropout is a no-op in eval mode, so the adapter can be applied
+            # together with the base weight in a single matmul. This is skipped
+            # when grads are enabled so that the adapter params still receive them
+            return F.linear(x, self._get_merged_weight(), self.bias)
+        out = self._base_forward(x)
+        if self._dropout_p > 0.0:
+            x = F.dropout(x, p=self._dropout_p, training=self.training)
+        lora_out = F.linear(x, self.pissa_u_weight)
+        lora_out = lora_out * self.pissa_s
+        lora_out = F.linear(lora_out, self.pissa_v_weight)
         return out + lora_out
 
+    def _disabled_forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self._base_forward(self._cast_input(x))
+
+    def _cast_input(self, x: torch.Tensor) -> torch.Tensor:
+        # Cast mismatched inputs (e.g. fp32 activations with bf16 weights) to the
+        # weight dtype, rather than having to upcast the much larger weight.
+        # Autocast already picks the compute dtype, so leave its inputs alone
+        if x.dtype != self.weight.dtype and not _is_autocast_enabled(x.device.type):
+            log_once(
+                _log,
+                f"PiSSALinear received {x.dtype} input for {self.weight.dtype} weights, "
+                f"casting inputs to {self.weight.dtype}. This may lose precision.",
+                level=logging.WARNING,
+            )
+            x = x.to(self.weight.dtype)
+        return x
+
+    def _base_forward(self, x: torch.Tensor) -> torch.Tensor:
+        if self._quantize_base:
+            return self._nf4_base_forward(x)
+        return self._dense_base_forward(x)
+
+    def _dense_base_forward(self, x: torch.Tensor) -> torch.Tensor:
+        return F.linear(x, self.weight, self.bias)
+
+    def _nf4_base_forward(self, x: torch.Tensor) -> torch.Tensor:
+        out = linear_nf4(input=x, weight=self.weight)
+        if self.bias is not None:
+            out = out + self.bias
+        return out
+
 class QATPiSSALinear(PiSSALinear):
     """
     PiSSA linear layer with quantization-aware training (QAT) applied to the
@@ -206,15 +393,19 @@ class QATPiSSALinear(PiSSALinear):
         in_dim (int): input dimension
         out_dim (int): output dimension
         rank (int): rank of the low-rank approximation
-        alpha (float): scaling factor for the low-rank approximation
+        alpha (float): unused by PiSSA, see :class:`PiSSALinear`
         dropout (float): dropout probability. Default: 0.0
         activation_qat_config (Optional[FakeQuantizeConfig]): config for specifying
             how input activations will be fake quantized, defaults to None
         weight_qat_config (Optional[FakeQuantizeConfig]): config for specifying
             how weights will be fake quantized, defaults to None
+        adapter_qat_config (Optional[FakeQuantizeConfig]): config for specifying
+            how the ``pissa_u_weight`` and ``pissa_v_weight`` will be fake quantized.
+            ``pissa_s`` is never fake quantized. Defaults to None
 
     Raises:
         ValueError: If `in_dim` is not divisible by weight `group_size`
+        ValueError: If `in_dim` or `rank` is not divisible by adapter `group_size`
 
     Example usage::
 
@@ -252,6 +443,7 @@ class QATPiSSALinear(PiSSALinear):
         # support torchao 0.7+ by default
         activation_qat_config: Optional["FakeQuantizeConfig"] = None,
         weight_qat_config: Optional["FakeQuantizeConfig"] = None,
+        adapter_qat_config: Optional["FakeQuantizeConfig"] = None,
     ):
         super().__init__(
             in_dim,
@@ -291,6 +483,51 @@ class QATPiSSALinear(PiSSALinear):
         else:
             self.weight_fake_quantizer = nn.Identity()
 
+        # initialize adapter weight fake quantizers, groups run along the
+        # input dim of each adapter weight, i.e. in_dim for U and rank for V
+        if adapter_qat_config is not None:
+            assert isinstance(adapter_qat_config, FakeQuantizeConfig)
+            group_size = adapter_qat_config.group_size
+            if group_size is not None and (
+                in_dim % group_size != 0 or rank % group_size != 0
+            ):
+                raise ValueError(
+                    "in_dim (%s) and rank (%s) must be divisible by group_size (%s)"
+                    % (in_dim, rank, group_size)
+                )
+            self.pissa_u_fake_quantizer = FakeQuantizer(adapter_qat_config)
+            self.pissa_v_fake_quantizer = FakeQuantizer(adapter_qat_config)
+        else:
+            self.pissa_u_fake_quantizer = nn.Identity()
+            self.pissa_v_fake_quantizer = nn.Identity()
+
+        # Activations are only fake quantized for the base projection, so in eval
+        # mode only pissa_s is folded into V, see ``_get_scaled_pissa_v``
+        self._scaled_pissa_v: Optional[torch.Tensor] = None
+        self._scaled_pissa_v_key: Optional[Tuple[Any, ...]] = None
+
+    def _clear_eval_caches(self) -> None:
+        super()._clear_eval_caches()
+        self._scaled_pissa_v = None
+        self._scaled_pissa_v_key = None
+
+    @torch.no_grad()
+    def _get_scaled_pissa_v(self) -> torch.Tensor:
+        """
+        Return the fake quantized ``pissa_v_weight`` with ``pissa_s`` folded into its
+        columns, recomputing it only if either has changed or fake quantization of V
+        has been toggled since the last call.
+        """
+        key = (
+            _param_versions(self.pissa_s, self.pissa_v_weight),
+            getattr(self.pissa_v_fake_quantizer, "enabled", None),
+        )
+        if self._scaled_pissa_v is None or key != self._scaled_pissa_v_key:
+            pissa_v = self.pissa_v_fake_quantizer(self.pissa_v_weight)
+            self._scaled_pissa_v = pissa_v * self.pissa_s
+            self._scaled_pissa_v_key = key
+        return self._scaled_pissa_v
+
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         """
         Args:
@@ -300,15 +537,23 @@ class QATPiSSALinear(PiSSALinear):
             torch.Tensor: output tensor with shape ``(..., out_dim)``
 
         """
+        x = self._cast_input(x)
+        out = self._base_forward(x)
+        if self._dropout_p > 0.0:
+            x = F.dropout(x, p=self._dropout_p, training=self.training)
+        pissa_u = self.pissa_u_fake_quantizer(self.pissa_u_weight)
+        lora_out = F.linear(x, pissa_u)
+        if not self.training and not torch.is_grad_enabled():
+            return out + F.linear(lora_out, self._get_scaled_pissa_v())
+        pissa_v = self.pissa_v_fake_quantizer(self.pissa_v_weight)
+        lora_out = lora_out * self.pissa_s
+        lora_out = F.linear(lora_out, pissa_v)
+        return out + lora_out
+
+    def _dense_base_forward(self, x: torch.Tensor) -> torch.Tensor:
         _x = self.activation_fake_quantizer(x)
         w = self.weight_fake_quantizer(self.weight)
-        out = F.linear(_x, w)
-        if self.disabled:
-            return out
-        lora_out = self.pissa_u(self.dropout(x))
-        lora_out = lora_out * self.pissa_s * (self.alpha / self.rank)
-        lora_out = self.pissa_v(lora_out)
-        return out + lora_out
+        return F.linear(_x, w)
 
     @classmethod
     def from_lora_linear(
@@ -318,6 +563,7 @@ class QATPiSSALinear(PiSSALinear):
         # support torchao 0.7+ by default
         activation_qat_config: Optional["FakeQuantizeConfig"] = None,
         weight_qat_config: Optional["FakeQuantizeConfig"] = None,
+        adapter_qat_config: Optional["FakeQuantizeConfig"] = None,
     ) -> "QATPiSSALinear":
         """
         Create a `QATPiSSALinear` from an existing `PiSSALinear`,
@@ -327,35 +573,34 @@ class QATPiSSALinear(PiSSALinear):
             ValueError("Bias is not supported in QAT + PiSSA yet")
         if lora_linear._quantize_base:
             ValueError("quantize_base is not compatible with QAT + PiSSA")
-        if isinstance(lora_linear.dropout, nn.Dropout):
-            dropout = lora_linear.dropout.p
-        else:
-            dropout = 0.0
         new_linear = cls(
             lora_linear.in_dim,
             lora_linear.out_dim,
             lora_linear.rank,
             lora_linear.alpha,
-            dropout,
+            lora_linear._dropout_p,
             activation_qat_config,
             weight_qat_config,
+            adapter_qat_config,
         )
         # In distributed training, the model may be instantiated
         # on the meta device, in which case there is no need to
         # copy the weights, and doing so will result in an error
         if lora_linear.weight.device != torch.device("meta"):
             new_linear.weight = lora_linear.weight
-        if lora_linear.pissa_u.weight.device != torch.device("meta"):
-            new_linear.pissa_u.weight = lora_linear.pissa_u.weight
-        if lora_linear.pissa_v.weight.device != torch.device("meta"):
-            new_linear.pissa_v.weight = lora_linear.pissa_v.weight
+        if lora_linear.pissa_u_weight.device != torch.device("meta"):
+            new_linear.pissa_u_weight = lora_linear.pissa_u_weight
+        if lora_linear.pissa_s.device != torch.device("meta"):
+            new_linear.pissa_s = lora_linear.pissa_s
+        if lora_linear.pissa_v_weight.device != torch.device("meta"):
+            new_linear.pissa_v_weight = lora_linear.pissa_v_weight
         return new_linear
 
-def _pissa_u_init_params(x: nn.Linear) -> None:
+def _pissa_u_init_params(x: nn.Parameter) -> None:
     """
     Initialize PiSSA U weight to Kaiming uniform.
     """
-    nn.init.kaiming_uniform_(x.weight, a=math.sqrt(5))
+    nn.init.kaiming_uniform_(x, a=math.sqrt(5))
 
 def _pissa_s_init_params(x: nn.Parameter) -> None:
     """
@@ -363,8 +608,29 @@ def _pissa_s_init_params(x: nn.Parameter) -> None:
     """
     nn.init.zeros_(x)
     
-def _pissa_v_init_params(x: nn.Linear) -> None:
+def _pissa_v_init_params(x: nn.Parameter) -> None:
     """
     Initialize PiSSA V weight to zeros.
     """
-    nn.init.kaiming_uniform_(x.weight, a=math.sqrt(5))
+    nn.init.kaiming_uniform_(x, a=math.sqrt(5))
+
+
+def _is_autocast_enabled(device_type: str) -> bool:
+    """
+    Whether autocast is enabled for ``device_type``. Without an argument
+    ``torch.is_autocast_enabled`` only reports CUDA autocast, and older torch
+    versions don't accept a device type.
+    """
+    if torch_version_ge("2.4.0"):
+        return torch.is_autocast_enabled(device_type)
+    if device_type == "cpu":
+        return torch.is_autocast_cpu_enabled()
+    return torch.is_autocast_enabled()
+
+
+def _param_versions(*params: torch.Tensor) -> Tuple[Tuple[Any, ...], ...]:
+    """
+    Identity, in-place version counter, device and dtype of each tensor, used to
+    invalidate the eval-mode caches when a parameter is replaced or updated.
+    """
+    return tuple((id(p), p._version, p.device, p.dtype) for p in params)